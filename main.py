@@ -4,13 +4,31 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.firefox.service import Service
 from selenium.webdriver.firefox.options import Options
+from selenium.webdriver.remote.client_config import ClientConfig
+from selenium.common.exceptions import (JavascriptException, NoSuchElementException, StaleElementReferenceException,
+                                        TimeoutException, WebDriverException)
 from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from datetime import datetime
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
 import os
+import re
+import atexit
+import asyncio
+import shutil
+import socket
+import aiohttp
+import threading
+import json
+import psutil
+import urllib.request
 import logging
-from time import sleep
+from time import sleep, time
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 import argparse
 import coloredlogs
 import verboselogs
@@ -31,26 +49,73 @@ HEADLESS_MODE = os.getenv('HEADLESS_MODE', 'true').lower() == 'true'
 DISABLE_BLINK_FEATURES = os.getenv('DISABLE_BLINK_FEATURES', 'true').lower() == 'true'
 EXCLUDE_AUTOMATION = os.getenv('EXCLUDE_AUTOMATION', 'true').lower() == 'true'
 
+# بک‌اند درایور: local (فایرفاکس روی همین سیستم) یا remote (Selenium Grid / standalone)
+DRIVER_BACKEND = os.getenv('DRIVER_BACKEND', 'local').lower()
+# لیست نودها با ظرفیت هر کدام، مثلا: http://node1:4444|8,http://node2:4444|4
+REMOTE_ENDPOINTS = os.getenv('REMOTE_ENDPOINTS', '')
+REMOTE_HEALTH_TTL = int(os.getenv('REMOTE_HEALTH_TTL', '30'))
+
+# مهلت کل هر اکانت (ثانیه) شامل همه تلاش‌ها، و تنظیمات واچ‌داگ
+ACCOUNT_DEADLINE = int(os.getenv('ACCOUNT_DEADLINE', '600'))
+WATCHDOG_INTERVAL = int(os.getenv('WATCHDOG_INTERVAL', '5'))
+WATCHDOG_GRACE = int(os.getenv('WATCHDOG_GRACE', '15'))
+
+# موتور اجرا: thread (ThreadPoolExecutor) یا async (asyncio)
+ENGINE = os.getenv('ENGINE', 'thread').lower()
+ASYNC_CONCURRENCY = int(os.getenv('ASYNC_CONCURRENCY', os.getenv('THREADS')))
+
+# محل ذخیره تاریخچه بالانس‌ها (Parquet)
+BALANCE_HISTORY_DIR = os.getenv('BALANCE_HISTORY_DIR', 'balance_history')
+
+# تنظیمات مانیتورینگ (پورت 0 یعنی غیرفعال)
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
+METRICS_ADDR = os.getenv('METRICS_ADDR', '127.0.0.1')
+
+# متریک‌های پرومتئوس
+INFLIGHT_DRIVERS = Gauge('poker_bot_inflight_drivers', 'Browser drivers currently running')
+QUEUED_ACCOUNTS = Gauge('poker_bot_queued_accounts', 'Accounts submitted to the pool and waiting for a worker')
+SCHEDULED_ACCOUNTS = Gauge('poker_bot_scheduled_accounts', 'Accounts waiting for their start_time')
+NEXT_SCHEDULED_START = Gauge('poker_bot_next_scheduled_start_timestamp', 'Unix time of the next scheduled account start (0 if none)')
+REGISTRATION_RESULTS = Counter('poker_bot_registration_total', 'Tournament registration outcomes', ['status'])
+BALANCE_CHECK_RESULTS = Counter('poker_bot_balance_check_total', 'Balance check outcomes', ['status'])
+DRIVER_START_SECONDS = Histogram('poker_bot_driver_start_seconds', 'Time to start a browser driver',
+                                 buckets=(1, 2, 5, 10, 20, 30, 60, 120))
+ENDPOINT_SESSIONS = Gauge('poker_bot_endpoint_sessions', 'Sessions running on each remote endpoint', ['endpoint'])
+ENDPOINT_HEALTHY = Gauge('poker_bot_endpoint_healthy', 'Whether a remote endpoint passed its last health check', ['endpoint'])
+REAPED_SESSIONS = Counter('poker_bot_reaped_sessions_total', 'Sessions killed by the watchdog after their deadline')
+LOCATOR_LOOKUPS = Counter('poker_bot_locator_lookups_total', 'Locator strategy hits and misses', ['element', 'strategy', 'result'])
+LOCATOR_BROKEN = Gauge('poker_bot_locator_broken', 'Whether every strategy of a locator is currently failing', ['element'])
+LOGIN_SECONDS = Histogram('poker_bot_login_seconds', 'Time from opening the login form to a verified login',
+                          buckets=(1, 2, 5, 10, 20, 30, 60))
+
 # تغییر در بخش پارس کردن آرگومان‌ها
 parser = argparse.ArgumentParser(description='Poker Tournament Registration Bot')
 
 # تغییر آرگومان اکسل به لیستی از فایل‌ها
-parser.add_argument('excel_files', type=str, nargs='+', help='Path to Excel file(s) containing accounts')
+parser.add_argument('excel_files', type=str, nargs='*', help='Path to Excel file(s) containing accounts')
 
 # حذف گروه متقابلاً انحصاری و اضافه کردن آرگومان‌های مستقل
 parser.add_argument('--event', action='store_true', help='Run tournament registration')
 parser.add_argument('--balance', action='store_true', help='Check balances')
+parser.add_argument('--history', choices=['deltas', 'totals', 'changed'],
+                    help='Query balance history instead of running (excel files, if given, filter the workbooks)')
+parser.add_argument('--since', type=str, help='First sweep id for --history (e.g. 20240101T200000)')
+parser.add_argument('--until', type=str, help='Last sweep id for --history')
+parser.add_argument('--engine', choices=['thread', 'async'], default=ENGINE, help='Execution engine (default: ENGINE from .env or thread)')
 
 args = parser.parse_args()
 
 # اگر هیچ عملیاتی انتخاب نشده، خطا نمایش داده شود
-if not (args.event or args.balance):
-    parser.error("At least one of --event or --balance must be specified")
+if not (args.event or args.balance or args.history):
+    parser.error("At least one of --event, --balance or --history must be specified")
+if not args.history and not args.excel_files:
+    parser.error("At least one Excel file must be specified")
 
 # تنظیم متغیرهای گلوبال
 CHECK_BALANCE = args.balance
 RUN_EVENT = args.event
 ACCOUNTS_FILE = args.excel_files
+ENGINE = args.engine
 
 def setup_main_logger():
     logger = verboselogs.VerboseLogger('Main')
@@ -135,82 +200,366 @@ def setup_logger(username):
     logger.addHandler(file_handler)
     return logger
 
-def create_driver(logger):
+# سشن‌های در حال اجرا: شناسه ترد -> نام کاربری، مهلت و پروسس‌های مرورگر
+_sessions = {}
+_sessions_lock = threading.Lock()
+_browser_process_names = ('firefox', 'firefox-bin', 'firefox-esr', 'geckodriver')
+
+def start_session(username, deadline_seconds=ACCOUNT_DEADLINE):
+    with _sessions_lock:
+        _sessions[threading.get_ident()] = {
+            'username': username,
+            'deadline': time() + deadline_seconds,
+            'processes': set(),
+            'remote_sessions': set(),
+            'reaped': False
+        }
+
+def end_session():
+    with _sessions_lock:
+        session = _sessions.pop(threading.get_ident(), None)
+    # اگر driver.quit() شکست خورده باشد، پروسس‌های باقی‌مانده را می‌کشیم
+    if session:
+        kill_session_browsers(session)
+
+def register_driver_processes(driver):
+    # psutil.Process زمان ساخت پروسس را نگه می‌دارد، پس PID بازیافت‌شده کشته نمی‌شود
+    processes = set()
+    remote_sessions = set()
+    endpoint = getattr(driver, 'remote_endpoint', None)
+    if endpoint:
+        # روی نود ریموت پروسسی نداریم، فقط سشن را نگه می‌داریم
+        remote_sessions.add((endpoint['url'], driver.session_id))
+    else:
+        pids = set()
+        try:
+            pids.add(driver.service.process.pid)
+        except Exception:
+            pass
+        firefox_pid = (driver.capabilities or {}).get('moz:processID')
+        if firefox_pid:
+            pids.add(firefox_pid)
+        for pid in pids:
+            try:
+                processes.add(psutil.Process(pid))
+            except psutil.Error:
+                pass
+    driver.browser_processes = processes
+    driver.remote_sessions = remote_sessions
+    with _sessions_lock:
+        session = _sessions.get(threading.get_ident())
+        if session:
+            session['processes'].update(processes)
+            session['remote_sessions'].update(remote_sessions)
+
+def unregister_driver_processes(driver):
+    # درایور درست بسته شده، پروسس‌هایش دیگر نباید کشته شوند
+    with _sessions_lock:
+        session = _sessions.get(threading.get_ident())
+        if session:
+            session['processes'].difference_update(getattr(driver, 'browser_processes', ()))
+            session['remote_sessions'].difference_update(getattr(driver, 'remote_sessions', ()))
+
+def kill_session_browsers(session):
+    with _sessions_lock:
+        processes = list(session['processes'])
+        remote_sessions = list(session['remote_sessions'])
+    for process in processes:
+        kill_process_tree(process)
+    for url, session_id in remote_sessions:
+        delete_remote_session(url, session_id)
+
+def remaining_time(timeout):
+    # هر انتظار به باقی‌مانده مهلت اکانت محدود می‌شود
+    with _sessions_lock:
+        session = _sessions.get(threading.get_ident())
+    if not session:
+        return timeout
+    remaining = session['deadline'] - time()
+    if remaining <= 0:
+        raise TimeoutException(f"Account deadline of {ACCOUNT_DEADLINE}s exceeded")
+    return min(timeout, remaining)
+
+def deadline_exceeded():
+    with _sessions_lock:
+        session = _sessions.get(threading.get_ident())
+    return bool(session) and session['deadline'] <= time()
+
+def open_url(driver, url):
+    # تایم‌اوت لود صفحه قبل از هر ناوبری دوباره به باقی‌مانده مهلت محدود می‌شود
+    driver.set_page_load_timeout(remaining_time(60))
+    driver.get(url)
+
+def kill_process_tree(parent):
     try:
-        options = Options()
-        
-        # تنظیم مسیر دقیق باینری فایرفاکس
-        firefox_binary = '/usr/bin/firefox'  # مسیر پیش‌فرض در اوبونتو
-        if not os.path.exists(firefox_binary):
-            firefox_binary = '/snap/bin/firefox'  # مسیر جایگزین برای نصب snap
-        
-        options.binary_location = firefox_binary
-        
-        if HEADLESS_MODE:
-            options.add_argument('--headless')
-            options.add_argument('--no-sandbox')
-            options.add_argument('--disable-dev-shm-usage')
-            options.add_argument('--disable-gpu')
-            options.add_argument('--window-size=1920,1080')
-            options.add_argument('--start-maximized')
-            options.add_argument('--disable-extensions')
-            
-            # تنظیمات اضافی برای حالت هدلس
-            options.set_preference('browser.cache.disk.enable', False)
-            options.set_preference('browser.cache.memory.enable', False)
-            options.set_preference('browser.cache.offline.enable', False)
-            options.set_preference('network.http.use-cache', False)
-        
-        if DISABLE_BLINK_FEATURES:
-            options.add_argument("--disable-blink-features=AutomationControlled")
-        
-        logger.info("Creating Firefox driver...")
-
-          # تنظیمات جدید برای رفع مشکل لود نشدن jQuery و iframe
-        options.set_preference("network.http.connection-timeout", 60000)
-        options.set_preference("dom.ipc.plugins.enabled.libflashplayer.so", True)
-        options.set_preference("media.navigator.permission.disabled", True)
-        options.set_preference("dom.webnotifications.enabled", False)
-        options.set_preference("dom.push.enabled", False)
-        
-        # تنظیمات امنیتی و دسترسی
-        options.set_preference("security.fileuri.strict_origin_policy", False)
-        options.set_preference("security.mixed_content.block_active_content", False)
-        options.set_preference("security.mixed_content.block_display_content", False)
-        options.set_preference("privacy.trackingprotection.enabled", False)
-        options.set_preference("network.http.referer.XOriginPolicy", 0)
-        options.set_preference("network.http.referer.spoofSource", True)
-        
-        # تنظیمات DNS و پروکسی
-        options.set_preference("network.proxy.type", 0)
-        options.set_preference("network.dns.disablePrefetch", False)
-        options.set_preference("network.prefetch-next", True)
-        
-        # تنظیمات JavaScript
-        options.set_preference("javascript.enabled", True)
-        options.set_preference("dom.disable_beforeunload", True)
-
-        
-        # تلاش برای یافن geckodriver
+        # is_running زمان ساخت را هم چک می‌کند
+        if not parent.is_running():
+            return
+        processes = parent.children(recursive=True) + [parent]
+    except psutil.Error:
+        return
+    for process in processes:
         try:
-            # اول تلاش می‌کنیم از مسیر نسبی
-            service = Service('./geckodriver')
-            driver = webdriver.Firefox(service=service, options=options)
+            process.kill()
+        except psutil.Error:
+            pass
+    psutil.wait_procs(processes, timeout=5)
+
+def watchdog_loop():
+    while True:
+        sleep(WATCHDOG_INTERVAL)
+        now = time()
+        with _sessions_lock:
+            expired = [session for session in _sessions.values()
+                       if not session['reaped'] and session['deadline'] + WATCHDOG_GRACE <= now]
+            for session in expired:
+                session['reaped'] = True
+        
+        for session in expired:
+            main_logger.warning(f"Session {session['username']} passed its deadline, killing browser")
+            kill_session_browsers(session)
+            REAPED_SESSIONS.inc()
+
+def start_watchdog():
+    threading.Thread(target=watchdog_loop, name='Watchdog', daemon=True).start()
+
+def is_browser_process(process):
+    try:
+        return process.name() in _browser_process_names
+    except psutil.Error:
+        # پروسس خارج شده یا دسترسی نداریم
+        return False
+
+def reap_browser_processes():
+    # پاکسازی firefox/geckodriver های یتیم در زمان خروج
+    try:
+        children = psutil.Process().children(recursive=True)
+    except psutil.NoSuchProcess:
+        return
+    leaked = [child for child in children if is_browser_process(child)]
+    if leaked:
+        main_logger.warning(f"Reaping {len(leaked)} leaked browser processes")
+        for child in leaked:
+            kill_process_tree(child)
+
+def parse_remote_endpoints(value):
+    endpoints = []
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        url, _, capacity = item.partition('|')
+        endpoints.append({
+            'url': url.strip().rstrip('/'),
+            'capacity': int(capacity) if capacity.strip() else THREADS,
+            'in_use': 0,
+            'healthy': False,
+            'checked_at': 0.0
+        })
+    return endpoints
+
+# نودهای ریموت و قفل مشترک برای انتخاب کم‌بارترین نود
+_endpoints = parse_remote_endpoints(REMOTE_ENDPOINTS)
+_endpoints_condition = threading.Condition(threading.RLock())
+_health_refresh_lock = threading.Lock()
+
+def check_endpoint_health(endpoint):
+    try:
+        with urllib.request.urlopen(f"{endpoint['url']}/status", timeout=5) as response:
+            status = json.load(response)
+        healthy = bool(status.get('value', {}).get('ready', False))
+    except Exception as e:
+        main_logger.warning(f"Health check failed for {endpoint['url']}: {e}")
+        healthy = False
+    ENDPOINT_HEALTHY.labels(endpoint=endpoint['url']).set(1 if healthy else 0)
+    return healthy
+
+def delete_remote_session(url, session_id):
+    try:
+        request = urllib.request.Request(f"{url}/session/{session_id}", method='DELETE')
+        urllib.request.urlopen(request, timeout=10).close()
+    except Exception:
+        pass
+
+def refresh_endpoint_health():
+    # فقط یک ترد چک سلامت را انجام می‌دهد، بقیه روی condition منتظر نتیجه می‌مانند
+    if not _health_refresh_lock.acquire(blocking=False):
+        return
+    try:
+        with _endpoints_condition:
+            stale = [endpoint for endpoint in _endpoints
+                     if time() - endpoint['checked_at'] > REMOTE_HEALTH_TTL]
+        
+        # درخواست‌های HTTP خارج از قفل
+        results = [(endpoint, check_endpoint_health(endpoint)) for endpoint in stale]
+        
+        with _endpoints_condition:
+            for endpoint, healthy in results:
+                endpoint['healthy'] = healthy
+                endpoint['checked_at'] = time()
+            if results:
+                _endpoints_condition.notify_all()
+    finally:
+        _health_refresh_lock.release()
+
+def try_acquire_endpoint(logger):
+    with _endpoints_condition:
+        available = [endpoint for endpoint in _endpoints
+                     if endpoint['healthy'] and endpoint['in_use'] < endpoint['capacity']]
+        if not available:
+            return None
+        endpoint = min(available, key=lambda e: e['in_use'] / e['capacity'])
+        endpoint['in_use'] += 1
+        ENDPOINT_SESSIONS.labels(endpoint=endpoint['url']).set(endpoint['in_use'])
+    logger.info(f"Using remote endpoint {endpoint['url']} ({endpoint['in_use']}/{endpoint['capacity']})")
+    return endpoint
+
+def acquire_endpoint(logger):
+    if not _endpoints:
+        raise RuntimeError("DRIVER_BACKEND is remote but REMOTE_ENDPOINTS is empty")
+    
+    while True:
+        refresh_endpoint_health()
+        
+        with _endpoints_condition:
+            endpoint = try_acquire_endpoint(logger)
+            if endpoint:
+                return endpoint
+            
+            # همه نودها پر یا خراب هستند، تا آزاد شدن ظرفیت صبر می‌کنیم
+            logger.debug("No remote endpoint available, waiting...")
+            _endpoints_condition.wait(timeout=remaining_time(5))
+
+def release_endpoint(endpoint):
+    with _endpoints_condition:
+        endpoint['in_use'] -= 1
+        ENDPOINT_SESSIONS.labels(endpoint=endpoint['url']).set(endpoint['in_use'])
+        _endpoints_condition.notify()
+
+def find_firefox_binary():
+    # تنظیم مسیر دقیق باینری فایرفاکس
+    firefox_binary = '/usr/bin/firefox'  # مسیر پیش‌فرض در اوبونتو
+    if not os.path.exists(firefox_binary):
+        firefox_binary = '/snap/bin/firefox'  # مسیر جایگزین برای نصب snap
+    return firefox_binary
+
+def start_local_driver(options, logger):
+    options.binary_location = find_firefox_binary()
+    
+    # تلاش برای یافن geckodriver
+    try:
+        # اول تلاش می‌کنیم از مسیر نسبی
+        service = Service('./geckodriver')
+        return webdriver.Firefox(service=service, options=options)
+    except Exception as e:
+        logger.warning(f"Could not create driver with relative path: {e}")
+        try:
+            # سپس تلاش می‌کنیم از مسیر کامل
+            service = Service('/usr/local/bin/geckodriver')
+            return webdriver.Firefox(service=service, options=options)
         except Exception as e:
-            logger.warning(f"Could not create driver with relative path: {e}")
-            try:
-                # سپس تلاش می‌کنیم از مسیر کامل
-                service = Service('/usr/local/bin/geckodriver')
-                driver = webdriver.Firefox(service=service, options=options)
-            except Exception as e:
-                logger.warning(f"Could not create driver with absolute path: {e}")
-                # در نهایت تلاش می‌کنیم از PATH سیستم
-                service = Service('geckodriver')
-                driver = webdriver.Firefox(service=service, options=options)
+            logger.warning(f"Could not create driver with absolute path: {e}")
+            # در نهایت تلاش می‌کنیم از PATH سیستم
+            service = Service('geckodriver')
+            return webdriver.Firefox(service=service, options=options)
+
+def start_remote_driver(options, logger):
+    endpoint = acquire_endpoint(logger)
+    try:
+        # صف Grid هم نباید از مهلت اکانت بیشتر طول بکشد
+        client_config = ClientConfig(remote_server_addr=endpoint['url'],
+                                     timeout=max(1, int(remaining_time(ACCOUNT_DEADLINE))))
+        driver = webdriver.Remote(command_executor=endpoint['url'], options=options, client_config=client_config)
+    except Exception:
+        release_endpoint(endpoint)
+        # نود احتمالا خراب است، دفعه بعد دوباره چک شود
+        with _endpoints_condition:
+            endpoint['checked_at'] = 0.0
+        raise
+    driver.remote_endpoint = endpoint
+    return driver
+
+def quit_driver(driver, logger):
+    try:
+        driver.quit()
+        unregister_driver_processes(driver)
+        logger.info("Driver closed")
+    except Exception as e:
+        logger.warning(f"Error closing driver: {e}")
+    finally:
+        INFLIGHT_DRIVERS.dec()
+        endpoint = getattr(driver, 'remote_endpoint', None)
+        if endpoint:
+            release_endpoint(endpoint)
+
+def build_firefox_options():
+    options = Options()
+    
+    if HEADLESS_MODE:
+        options.add_argument('--headless')
+        options.add_argument('--no-sandbox')
+        options.add_argument('--disable-dev-shm-usage')
+        options.add_argument('--disable-gpu')
+        options.add_argument('--window-size=1920,1080')
+        options.add_argument('--start-maximized')
+        options.add_argument('--disable-extensions')
         
-        driver.set_page_load_timeout(60)
-        driver.set_script_timeout(60)
+        # تنظیمات اضافی برای حالت هدلس
+        options.set_preference('browser.cache.disk.enable', False)
+        options.set_preference('browser.cache.memory.enable', False)
+        options.set_preference('browser.cache.offline.enable', False)
+        options.set_preference('network.http.use-cache', False)
+    
+    if DISABLE_BLINK_FEATURES:
+        options.add_argument("--disable-blink-features=AutomationControlled")
+    
+    # تنظیمات جدید برای رفع مشکل لود نشدن jQuery و iframe
+    options.set_preference("network.http.connection-timeout", 60000)
+    options.set_preference("dom.ipc.plugins.enabled.libflashplayer.so", True)
+    options.set_preference("media.navigator.permission.disabled", True)
+    options.set_preference("dom.webnotifications.enabled", False)
+    options.set_preference("dom.push.enabled", False)
+    
+    # تنظیمات امنیتی و دسترسی
+    options.set_preference("security.fileuri.strict_origin_policy", False)
+    options.set_preference("security.mixed_content.block_active_content", False)
+    options.set_preference("security.mixed_content.block_display_content", False)
+    options.set_preference("privacy.trackingprotection.enabled", False)
+    options.set_preference("network.http.referer.XOriginPolicy", 0)
+    options.set_preference("network.http.referer.spoofSource", True)
+    
+    # تنظیمات DNS و پروکسی
+    options.set_preference("network.proxy.type", 0)
+    options.set_preference("network.dns.disablePrefetch", False)
+    options.set_preference("network.prefetch-next", True)
+    
+    # تنظیمات JavaScript
+    options.set_preference("javascript.enabled", True)
+    options.set_preference("dom.disable_beforeunload", True)
+    
+    return options
+
+def create_driver(logger):
+    try:
+        options = build_firefox_options()
+        logger.info(f"Creating Firefox driver ({DRIVER_BACKEND} backend)...")
         
+        started = time()
+        if DRIVER_BACKEND == 'remote':
+            driver = start_remote_driver(options, logger)
+        else:
+            driver = start_local_driver(options, logger)
+        
+        INFLIGHT_DRIVERS.inc()
+        try:
+            register_driver_processes(driver)
+            driver.set_page_load_timeout(remaining_time(60))
+            driver.set_script_timeout(remaining_time(60))
+        except Exception:
+            quit_driver(driver, logger)
+            raise
+        
+        DRIVER_START_SECONDS.observe(time() - started)
         logger.info("Firefox driver created successfully")
         return driver
         
@@ -234,9 +583,16 @@ def retry_on_failure(max_attempts=3, delay=5):
                     # گرفتن logger از پارامترها یا ساخت یک logger جدید
                     logger = kwargs.get('logger', main_logger)
                     
+                    if deadline_exceeded():
+                        logger.error(f"Deadline exceeded for {func.__name__} after {attempts} attempts. Last error: {str(e)}")
+                        break
                     if attempts < max_attempts:
                         logger.warning(f"Attempt {attempts}/{max_attempts} failed: {str(e)}")
-                        sleep(delay)
+                        try:
+                            sleep(remaining_time(delay))
+                        except TimeoutException:
+                            logger.error(f"Deadline exceeded for {func.__name__} after {attempts} attempts. Last error: {str(e)}")
+                            break
                     else:
                         logger.error(f"All {max_attempts} attempts failed for {func.__name__}. Last error: {str(e)}")
             
@@ -244,6 +600,202 @@ def retry_on_failure(max_attempts=3, delay=5):
         return wrapper
     return decorator
 
+# رجیستری لوکیتورها: هر المنت منطقی چند استراتژی دارد (id, css, xpath, text)
+# همه استراتژی‌های یک المنت باید دقیقا همان ساختار را هدف بگیرند، نه المنت‌های مشابه
+# ترتیب استراتژی‌ها در طول اجرا بر اساس نرخ موفقیت و سرعت به‌روز می‌شود
+LOCATORS = {
+    'announcement_close': [
+        ['css', "#announcementPopup button.close"],
+        ['xpath', "//*[@id='announcementPopup']//button[contains(concat(' ', normalize-space(@class), ' '), ' close ')]"],
+    ],
+    'login_button': [
+        ['xpath', '/html/body/div[2]/header/section[2]/nav/button[1]'],
+        ['css', "header > section:nth-of-type(2) > nav > button:first-of-type"],
+    ],
+    'login_username': [
+        ['xpath', '//*[@id="loginStepStarter"]/label[1]/input'],
+        ['css', "#loginStepStarter > label:nth-of-type(1) > input"],
+    ],
+    'login_password': [
+        ['xpath', '//*[@id="loginStepStarter"]/label[2]/input'],
+        ['css', "#loginStepStarter > label:nth-of-type(2) > input"],
+    ],
+    'login_submit': [
+        ['xpath', '//*[@id="loginStepStarter"]/button'],
+        ['css', "#loginStepStarter > button"],
+    ],
+    'login_verify': [
+        ['id', "memberSecureWordVerify"],
+        ['xpath', '//*[@id="memberSecureWordVerify"]'],
+    ],
+    'poker_button': [
+        ['xpath', '/html/body/div[2]/main/div[1]/article/main/section[3]/div[1]/div[2]/a[1]'],
+        ['css', "article > main > section:nth-of-type(3) > div:nth-of-type(1) > div:nth-of-type(2) > a:first-of-type"],
+    ],
+    'poker_iframe': [
+        ['css', "iframe[src*='pokerplaza']"],
+        ['xpath', "//iframe[contains(@src, 'pokerplaza')]"],
+    ],
+    'lobby_root': [
+        ['id', "root"],
+    ],
+    'tournament_link': [
+        ['css', ".category__link[href='/tournaments']"],
+        ['xpath', "//*[contains(concat(' ', normalize-space(@class), ' '), ' category__link ') and @href='/tournaments']"],
+    ],
+    'register_modal_button': [
+        ['xpath', '/html/body/div[1]/div/div[2]/div/view/div/div[2]/button'],
+        ['css', "view > div > div:nth-of-type(2) > button"],
+        ['xpath', "//view/div/div[2]/button"],
+    ],
+    'balance_dropdown': [
+        ['id', "headerBalances"],
+        ['css', "#headerBalances"],
+    ],
+    'balance_list': [
+        ['id', "dropdownBalanceList"],
+    ],
+}
+
+# همه استراتژی‌ها در یک رفت‌وبرگشت به مرورگر امتحان می‌شوند
+LOCATOR_PROBE_JS = """
+var strategies = arguments[0], clickable = arguments[1], timings = [];
+function usable(el) {
+    if (!el) return false;
+    if (!clickable) return true;
+    var style = window.getComputedStyle(el);
+    return el.getClientRects().length > 0 && style.visibility !== 'hidden' && !el.disabled;
+}
+for (var i = 0; i < strategies.length; i++) {
+    var kind = strategies[i][0], value = strategies[i][1], started = performance.now(), el = null;
+    try {
+        if (kind === 'id') {
+            el = document.getElementById(value);
+        } else if (kind === 'css') {
+            el = document.querySelector(value);
+        } else if (kind === 'xpath') {
+            el = document.evaluate(value, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+        } else if (kind === 'text') {
+            var candidates = document.querySelectorAll('button, a, [role="button"], label');
+            for (var j = 0; j < candidates.length; j++) {
+                if (candidates[j].textContent.trim().indexOf(value) !== -1 && usable(candidates[j])) {
+                    el = candidates[j];
+                    break;
+                }
+            }
+        }
+    } catch (e) {
+        el = null;
+    }
+    timings.push(performance.now() - started);
+    if (usable(el)) return {index: i, element: el, timings: timings};
+}
+return {index: -1, element: null, timings: timings};
+"""
+
+LOCATOR_FAILURE_THRESHOLD = int(os.getenv('LOCATOR_FAILURE_THRESHOLD', '3'))
+
+# المنت‌هایی که ممکن است اصلا در صفحه نباشند (مثل پاپ‌آپ تبلیغ) خراب حساب نمی‌شوند
+OPTIONAL_LOCATORS = {'announcement_close'}
+
+_locator_lock = threading.Lock()
+_locator_stats = {}     # (نام المنت، استراتژی) -> آمار
+_locator_failures = {}  # نام المنت -> تعداد شکست‌های پشت سر هم
+
+def ordered_strategies(name):
+    with _locator_lock:
+        return [list(strategy) for strategy in LOCATORS[name]]
+
+def strategy_score(name, strategy):
+    stats = _locator_stats.get((name, tuple(strategy)))
+    if not stats:
+        return (-0.5, 0.0)
+    attempts = stats['hits'] + stats['misses']
+    found = stats['found_seconds'] / stats['hits'] if stats['hits'] else float('inf')
+    probe = stats['probe_ms'] / attempts if attempts else 0.0
+    # نرخ موفقیت با هموارسازی لاپلاس، سپس زمان تا پیدا شدن، سپس هزینه پروب
+    return (-(stats['hits'] + 1) / (attempts + 2), found, probe)
+
+def record_locator_result(name, strategies, result, elapsed):
+    timings = (result or {}).get('timings') or []
+    index = (result or {}).get('index', -1)
+    
+    with _locator_lock:
+        # استراتژی‌هایی که در آخرین پروب امتحان شدند
+        tried = strategies[:len(timings)] if timings else strategies
+        for position, strategy in enumerate(tried):
+            stats = _locator_stats.setdefault((name, tuple(strategy)),
+                                              {'hits': 0, 'misses': 0, 'probe_ms': 0.0, 'found_seconds': 0.0})
+            hit = position == index
+            # زمان اجرای این استراتژی در پروب، چه پیدا شده باشد چه نه
+            if position < len(timings):
+                stats['probe_ms'] += timings[position]
+            if hit:
+                stats['hits'] += 1
+                # زمان واقعی انتظار تا پیدا شدن المنت
+                stats['found_seconds'] += elapsed
+            else:
+                stats['misses'] += 1
+            LOCATOR_LOOKUPS.labels(element=name, strategy=strategy[0], result='hit' if hit else 'miss').inc()
+        
+        # استراتژی برنده به ابتدای لیست می‌رود (sort پایدار است)
+        LOCATORS[name].sort(key=lambda strategy: strategy_score(name, strategy))
+        
+        if index >= 0 or name in OPTIONAL_LOCATORS:
+            _locator_failures[name] = 0
+            LOCATOR_BROKEN.labels(element=name).set(0)
+            return
+        
+        _locator_failures[name] = _locator_failures.get(name, 0) + 1
+        failures = _locator_failures[name]
+    
+    main_logger.debug(f"Locator {name} failed after {elapsed:.1f}s")
+    if failures == LOCATOR_FAILURE_THRESHOLD:
+        LOCATOR_BROKEN.labels(element=name).set(1)
+        main_logger.critical(f"All strategies are failing for locator '{name}' ({failures} lookups in a row) - site layout may have changed")
+
+def locate(driver, name, timeout, clickable=False):
+    strategies = ordered_strategies(name)
+    started = time()
+    probe = {}
+    
+    def attempt(driver):
+        probe['result'] = driver.execute_script(LOCATOR_PROBE_JS, strategies, clickable)
+        return probe['result']['element'] or False
+    
+    # اگر مهلت اکانت تمام شده باشد خطا همین‌جا بالا می‌رود و شکست لوکیتور حساب نمی‌شود
+    wait = remaining_time(timeout)
+    
+    try:
+        # هنگام ناوبری صفحه، اجرای پروب ممکن است خطای جاوااسکریپت یا stale بدهد
+        element = WebDriverWait(driver, wait,
+                                ignored_exceptions=(JavascriptException, StaleElementReferenceException)).until(attempt)
+    except TimeoutException:
+        if wait < timeout:
+            # انتظار با مهلت اکانت کوتاه شده، نه با تایم‌اوت خود المنت
+            raise TimeoutException(f"Account deadline of {ACCOUNT_DEADLINE}s exceeded while waiting for '{name}'")
+        record_locator_result(name, strategies, probe.get('result'), time() - started)
+        raise TimeoutException(f"Element '{name}' not found with any locator strategy")
+    
+    record_locator_result(name, strategies, probe['result'], time() - started)
+    return element
+
+def log_locator_report():
+    with _locator_lock:
+        for name, strategies in LOCATORS.items():
+            for strategy in strategies:
+                stats = _locator_stats.get((name, tuple(strategy)))
+                if not stats:
+                    continue
+                attempts = stats['hits'] + stats['misses']
+                found = stats['found_seconds'] / stats['hits'] if stats['hits'] else 0.0
+                probe = stats['probe_ms'] / attempts if attempts else 0.0
+                main_logger.info(f"Locator {name} [{strategy[0]}] {strategy[1]}: "
+                                 f"{stats['hits']} hits, {stats['misses']} misses, "
+                                 f"{found:.2f}s avg to found, {probe:.1f} ms avg probe")
+            if _locator_failures.get(name, 0) >= LOCATOR_FAILURE_THRESHOLD:
+                main_logger.warning(f"Locator {name} is failing with every strategy")
+
 @retry_on_failure(max_attempts=3, delay=5)
 def login_and_register(account):
     username = account['username']
@@ -251,7 +803,8 @@ def login_and_register(account):
     driver = None
 
     try:
-        if not CHECK_BALANCE and account['registered']:
+        # اکانت‌های فیلتردار ممکن است هنوز در تورنمنت‌های دیگری ثبت‌نام نکرده باشند
+        if not CHECK_BALANCE and account['registered'] and not has_tournament_filter(account):
             logger.info(f"Account {username} is already registered for tournament: {account['registered_tournament']}")
             return
             
@@ -265,15 +818,13 @@ def login_and_register(account):
         driver = create_driver(logger)
         
         # ... بقیه کد ...
-        driver.get("https://www.pokerklas628.com/")
+        open_url(driver, "https://www.pokerklas628.com/")
         logger.info("Website loaded successfully")
         # بستن تبلیغ
         try:
-            WebDriverWait(driver, 5).until(
-                EC.element_to_be_clickable((By.CSS_SELECTOR, "#announcementPopup button.close"))
-            ).click()
+            locate(driver, 'announcement_close', 5, clickable=True).click()
             logger.info("Advertisement closed")
-            sleep(1)
+            sleep(remaining_time(1))
         except Exception as e:
             logger.warning("Trying to close advertisement with JavaScript...")
             try:
@@ -287,24 +838,21 @@ def login_and_register(account):
                 logger.warning("Could not close advertisement")
 
         # لاگین
-        WebDriverWait(driver, 10).until(
-            EC.element_to_be_clickable((By.XPATH, '/html/body/div[2]/header/section[2]/nav/button[1]'))
-        ).click()
-        
+        # فقط لاگین موفق در هیستوگرام ثبت می‌شود
+        login_started = time()
+        locate(driver, 'login_button', 10, clickable=True).click()
+
         # وارد کردن اطلاعات کاربری
-        WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.XPATH, '//*[@id="loginStepStarter"]/label[1]/input'))
-        ).send_keys(username)
-        driver.find_element(By.XPATH, '//*[@id="loginStepStarter"]/label[2]/input').send_keys(account['password'])
-        driver.find_element(By.XPATH, '//*[@id="loginStepStarter"]/button').click()
+        locate(driver, 'login_username', 10).send_keys(username)
+        locate(driver, 'login_password', 5).send_keys(account['password'])
+        locate(driver, 'login_submit', 5).click()
 
         # تایید لاگین
-        WebDriverWait(driver, 10).until(
-            EC.element_to_be_clickable((By.XPATH, '//*[@id="memberSecureWordVerify"]'))
-        ).click()
+        locate(driver, 'login_verify', 10, clickable=True).click()
+        LOGIN_SECONDS.observe(time() - login_started)
         
         logger.info("Login successful")
-        sleep(2)
+        sleep(remaining_time(2))
 
         # اگر در حالت چک بالانس هستم
         if CHECK_BALANCE:
@@ -316,60 +864,52 @@ def login_and_register(account):
 
         # رفتن به صفحه پوکر
         logging.info("Navigating to poker page...")
-        driver.get("https://www.pokerklas628.com/tablegames/poker")
+        open_url(driver, "https://www.pokerklas628.com/tablegames/poker")
         
         # صبر برای لود شدن jQuery
-        WebDriverWait(driver, 20).until(
+        WebDriverWait(driver, remaining_time(20)).until(
             lambda driver: driver.execute_script("return typeof jQuery !== 'undefined'")
         )
         logging.info("jQuery loaded successfully")
         
         # کلیک روی دکمه پوکر
-        WebDriverWait(driver, 20).until(
-            EC.element_to_be_clickable((By.XPATH, '/html/body/div[2]/main/div[1]/article/main/section[3]/div[1]/div[2]/a[1]'))
-        ).click()
+        locate(driver, 'poker_button', 20, clickable=True).click()
         logging.info("Clicked on poker button")
         
         # به جای کار با iframe، مستقیماً URL رو باز می‌کنیم
         try:
             logging.info("Finding poker URL...")
             # صبر برای لود شدن iframe و گرفتن URL آن
-            iframe = WebDriverWait(driver, 20).until(
-                lambda x: x.find_element(By.CSS_SELECTOR, "iframe[src*='pokerplaza']")
-            )
+            iframe = locate(driver, 'poker_iframe', 20)
             poker_url = iframe.get_attribute('src')
             logging.info(f"Found poker URL: {poker_url}")
             
             # باز کردن مستقیم URL
-            driver.get(poker_url)
+            open_url(driver, poker_url)
             logging.info("Navigated to poker URL directly")
             
             # صبر برای لود شدن صفحه
-            WebDriverWait(driver, 30).until(
-                EC.presence_of_element_located((By.XPATH, '//*[@id="root"]'))
-            )
+            locate(driver, 'lobby_root', 30)
             logging.info("Found root element")
             
             # صبر برای ناپدید شدن لودینگ
-            WebDriverWait(driver, 30).until(
+            WebDriverWait(driver, remaining_time(30)).until(
                 EC.invisibility_of_element_located((By.CLASS_NAME, "lobby-loader"))
             )
             logging.info("Loading completed")
             
             # کمی تاخیر اضافی
-            sleep(4)
+            sleep(remaining_time(4))
             
             # کلیک روی لینک تورنمنت‌ها
             try:
                 # اول با سلکتور CSS امتحان می‌کنی
                 logging.info("Trying to find tournament link...")
-                tournament_link = WebDriverWait(driver, 30).until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, ".category__link[href='/tournaments']"))
-                )
+                tournament_link = locate(driver, 'tournament_link', 30)
                 logging.info("Tournament link found")
                 
                 # کمی صبر می‌کنیم
-                sleep(2)
+                sleep(remaining_time(2))
                 
                 # اول با جاوااسکیپت امتحان می‌کنیم
                 try:
@@ -394,17 +934,17 @@ def login_and_register(account):
                         logging.info("Clicked tournament link with normal click")
                 
                 # صبر برای تغییر صفحه
-                sleep(3)
+                sleep(remaining_time(3))
                 
                 # تایید موفقیت‌آمیز بودن کلیک
-                WebDriverWait(driver, 10).until(
+                WebDriverWait(driver, remaining_time(10)).until(
                     lambda x: "tournament" in driver.current_url.lower() or 
                              len(driver.find_elements(By.CLASS_NAME, "tournament-list")) > 0
                 )
                 logging.info("Successfully navigated to tournament page")
                 
                 # ثبت‌نام در تورنمنت
-                registration_result = handle_tournament_registration(driver, username)
+                registration_result = handle_tournament_registration(driver, account)
                 
                 # ذخیره نتیجه یا ارسال به سیسم دیگر
                 logging.info(f"Tournament registration completed: {registration_result}")
@@ -423,133 +963,301 @@ def login_and_register(account):
         raise  # اجازه میدیم خطا به دکوریتور برسه
     finally:
         if driver:
-            try:
-                driver.quit()
-                logger.info("Driver closed")
-            except Exception as e:
-                logger.warning(f"Error closing driver: {e}")
+            quit_driver(driver, logger)
+
+def process_account(account):
+    # اکانت از صف خارج شده و یک ورکر آن را برداشته
+    QUEUED_ACCOUNTS.dec()
+    start_session(account['username'])
+    try:
+        return login_and_register(account)
+    finally:
+        end_session()
+
+def submit_accounts(executor, accounts):
+    QUEUED_ACCOUNTS.inc(len(accounts))
+    return [executor.submit(process_account, account) for account in accounts]
+
+def parse_amount(text):
+    # استخراج عدد از متن‌هایی مثل "1.000,50 TRY"
+    match = re.search(r'-?\d[\d.,]*', text or '')
+    if not match:
+        return None
+    number = match.group(0).rstrip('.,')
+    if ',' in number and '.' in number:
+        # جداکننده‌ای که آخر آمده اعشار است
+        if number.rfind(',') > number.rfind('.'):
+            number = number.replace('.', '').replace(',', '.')
+        else:
+            number = number.replace(',', '')
+    elif '.' in number:
+        # قالب ترکی: نقطه با سه رقم بعدش جداکننده هزارگان است
+        if re.fullmatch(r'\d{1,3}(\.\d{3})+', number):
+            number = number.replace('.', '')
+    else:
+        number = number.replace(',', '.')
+    try:
+        return float(number)
+    except ValueError:
+        return None
+
+def has_tournament_filter(account):
+    return bool(account.get('target_tournaments') or account.get('tournament_pattern')
+                or account.get('min_buyin') is not None or account.get('max_buyin') is not None
+                or account.get('start_after') is not None or account.get('start_before') is not None)
+
+def tournament_matches(tournament_info, account):
+    name = tournament_info['name'].strip().casefold()
+    
+    # فیلتر بر اساس لیست نام‌ها: نام کامل و دقیق (جستجوی تقریبی با tournament_pattern)
+    targets = account.get('target_tournaments')
+    if targets and name not in {target.strip().casefold() for target in targets}:
+        return False
+    
+    # فیلتر بر اساس الگوی نام
+    pattern = account.get('tournament_pattern')
+    if pattern and not pattern.search(tournament_info['name']):
+        return False
+    
+    # فیلتر بر اساس بای‌این
+    if account.get('min_buyin') is not None or account.get('max_buyin') is not None:
+        buyin = parse_amount(tournament_info['buyin'])
+        if buyin is None:
+            return False
+        if account.get('min_buyin') is not None and buyin < account['min_buyin']:
+            return False
+        if account.get('max_buyin') is not None and buyin > account['max_buyin']:
+            return False
+    
+    # فیلتر بر اساس بازه زمان شروع
+    if account.get('start_after') is not None or account.get('start_before') is not None:
+        start = pd.to_datetime(tournament_info['date'], dayfirst=True, errors='coerce')
+        if pd.isna(start):
+            return False
+        if account.get('start_after') is not None and start < account['start_after']:
+            return False
+        if account.get('start_before') is not None and start > account['start_before']:
+            return False
+    
+    return True
+
+def read_tournament_info(tournament):
+    return {
+        'date': tournament.find_element(By.CLASS_NAME, "tournaments-list__date").text,
+        'name': tournament.find_element(By.CLASS_NAME, "tournaments-list__name-text").text,
+        'players': tournament.find_element(By.CLASS_NAME, "tournaments-list__player-count").text,
+        'buyin': tournament.find_element(By.CLASS_NAME, "tournaments-list__buyin-text").text,
+        'prize': tournament.find_element(By.CLASS_NAME, "tournaments-list__prize-text").text
+    }
 
-def handle_tournament_registration(driver, username):
+def register_for_tournament(driver, tournament, tournament_info):
+    try:
+        # بررسی دکمه unregister
+        tournament.find_element(By.CSS_SELECTOR, "button.error")
+        logging.info(f"Found unregister button - User is already registered in {tournament_info['name']}")
+        return {
+            'status': 'already_registered',
+            'tournament': tournament_info,
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+        
+    except Exception:
+        try:
+            # کلیک روی دکمه register
+            register_button = tournament.find_element(By.CSS_SELECTOR, "button.tournaments__right-register")
+            logging.info("Found register button - Proceeding with registration")
+            register_button.click()
+            logging.info("Clicked first register button")
+            sleep(remaining_time(2))
+            
+            # منتظر باز شدن فریم و کلیک روی دکمه register داخل فریم
+            register_confirm = locate(driver, 'register_modal_button', 10, clickable=True)
+            register_confirm.click()
+            logging.info("Clicked register confirm button")
+            sleep(remaining_time(2))
+            
+            # منتظر تغییر محتوای فریم و کلیک روی دکمه OK
+            ok_button = locate(driver, 'register_modal_button', 10, clickable=True)
+            ok_button.click()
+            logging.info("Clicked final OK button")
+            sleep(remaining_time(2))
+            
+            return {
+                'status': 'success',
+                'tournament': tournament_info,
+                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            }
+            
+        except Exception as e:
+            # خطای پایان مهلت اکانت نباید به عنوان خطای یک تورنمنت ثبت شود
+            if deadline_exceeded():
+                raise
+            logging.error(f"Error during registration process for {tournament_info['name']}: {e}")
+            return {
+                'status': 'error',
+                'tournament': tournament_info,
+                'error': str(e),
+                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            }
+
+def summarize_registration(results):
+    statuses = [result['status'] for result in results]
+    if 'success' in statuses:
+        return 'success'
+    if statuses and all(status == 'already_registered' for status in statuses):
+        return 'already_registered'
+    if not statuses:
+        return 'no_match'
+    return 'error'
+
+def save_registration_results(account, results):
+    # بروزرسانی اطلاعات در فایل اکسل
+    registered_names = list(account.get('registered_tournament') or [])
+    for result in results:
+        if result['status'] in ('success', 'already_registered') and result['tournament']['name'] not in registered_names:
+            registered_names.append(result['tournament']['name'])
+    
+    if registered_names:
+        update_account_info(
+            account['excel_file'],
+            account['username'],
+            registered=True,
+            tournament_name=registered_names
+        )
+
+def handle_tournament_registration(driver, account):
+    username = account['username']
     try:
         logging.info("Starting tournament registration process...")
         
         # صبر برای لود شدن لیست تورنمنت‌ها
-        WebDriverWait(driver, 20).until(
+        WebDriverWait(driver, remaining_time(20)).until(
             EC.presence_of_element_located((By.CLASS_NAME, "tournaments-list__item"))
         )
         logging.info("Tournament list loaded")
         
-        # گرفتن اطلاعات اولین ترنمنت
-        first_tournament = driver.find_element(By.CLASS_NAME, "tournaments-list__item")
-        tournament_info = {
-            'date': first_tournament.find_element(By.CLASS_NAME, "tournaments-list__date").text,
-            'name': first_tournament.find_element(By.CLASS_NAME, "tournaments-list__name-text").text,
-            'players': first_tournament.find_element(By.CLASS_NAME, "tournaments-list__player-count").text,
-            'buyin': first_tournament.find_element(By.CLASS_NAME, "tournaments-list__buyin-text").text,
-            'prize': first_tournament.find_element(By.CLASS_NAME, "tournaments-list__prize-text").text
-        }
-        logging.info(f"Tournament details: {tournament_info}")
+        # بدون فیلتر فقط اولین تورنمنت، مثل قبل
+        multi = has_tournament_filter(account)
+        results = []
+        count = len(driver.find_elements(By.CLASS_NAME, "tournaments-list__item"))
         
-        try:
-            # بررسی دکمه unregister
-            unregister_button = first_tournament.find_element(By.CSS_SELECTOR, "button.error")
-            logging.info("Found unregister button - User is already registered")
-
-            update_account_info(
-                ACCOUNTS_FILE,
-                username,
-                registered=True,
-                tournament_name=tournament_info['name']
-            )
-
-            return {
-                'status': 'already_registered',
-                'tournament': tournament_info,
-                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            }
+        for index in range(count):
+            # بعد از پایان مهلت اکانت سراغ تورنمنت بعدی نمی‌رویم
+            if deadline_exceeded():
+                logging.warning(f"Account deadline exceeded, skipping remaining tournaments for {username}")
+                break
+            
+            # بعد از هر ثبت‌نام لیست دوباره رندر می‌شود، پس هر بار از نو پیدا می‌کنیم
+            items = driver.find_elements(By.CLASS_NAME, "tournaments-list__item")
+            if index >= len(items):
+                break
+            tournament = items[index]
             
-        except Exception:
             try:
-                # کلیک روی دکمه register
-                register_button = first_tournament.find_element(By.CSS_SELECTOR, "button.tournaments__right-register")
-                logging.info("Found register button - Proceeding with registration")
-                register_button.click()
-                logging.info("Clicked first register button")
-                sleep(2)
-                
-                # منتظر باز شدن فریم و کلیک روی دکمه register داخل فریم
-                register_confirm = WebDriverWait(driver, 10).until(
-                    EC.element_to_be_clickable((By.XPATH, '/html/body/div[1]/div/div[2]/div/view/div/div[2]/button'))
-                )
-                register_confirm.click()
-                logging.info("Clicked register confirm button")
-                sleep(2)
-                
-                # منتظر تغییر محتوای فریم و کلیک روی دکمه OK
-                ok_button = WebDriverWait(driver, 10).until(
-                    EC.element_to_be_clickable((By.XPATH, '/html/body/div[1]/div/div[2]/div/view/div/div[2]/button'))
-                )
-                ok_button.click()
-                logging.info("Clicked final OK button")
-                sleep(2)
-                
-                # بروزرسانی اطلاعات در فایل اکسل
-                update_account_info(
-                    ACCOUNTS_FILE,
-                    username,
-                    registered=True,
-                    tournament_name=tournament_info['name']
-                )
-                
-                return {
-                    'status': 'success',
-                    'tournament': tournament_info,
-                    'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                }
-                
+                tournament_info = read_tournament_info(tournament)
             except Exception as e:
-                logging.error(f"Error during registration process: {e}")
-                return {
-                    'status': 'error',
-                    'error': str(e),
-                    'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                }
+                # بدون فیلتر فقط اولین تورنمنت مجاز است، نباید سراغ بعدی برویم
+                if not multi:
+                    raise
+                logging.warning(f"Could not read tournament #{index + 1}: {e}")
+                continue
+            
+            if multi and not tournament_matches(tournament_info, account):
+                continue
+            
+            logging.info(f"Tournament details: {tournament_info}")
+            try:
+                result = register_for_tournament(driver, tournament, tournament_info)
+            except Exception as e:
+                # فقط خطای پایان مهلت به اینجا می‌رسد؛ نتایج قبلی همچنان ذخیره می‌شوند
+                logging.warning(f"Account deadline exceeded during registration for {username}: {e}")
+                break
+            REGISTRATION_RESULTS.labels(status=result['status']).inc()
+            results.append(result)
+            
+            if not multi:
+                break
+        
+        if multi and not results:
+            logging.warning(f"No tournament matched the filters for {username}")
+        
+        save_registration_results(account, results)
+        
+        return {
+            'status': summarize_registration(results),
+            'results': results,
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
                 
     except Exception as e:
         logging.error(f"Error during tournament registration: {e}")
+        REGISTRATION_RESULTS.labels(status='error').inc()
         return {
             'status': 'error',
             'error': str(e),
+            'results': [],
             'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         }
 
+_excel_lock = threading.Lock()
+
 def update_account_info(excel_path, username, poker_balance=None, poker_game_balance=None, 
                        casino_balance=None, registered=None, tournament_name=None, last_check_time=None):
     try:
-        df = pd.read_excel(excel_path)
-        
-        # آپدیت اطلاعات موجد
-        if poker_balance is not None:
-            df.loc[df['username'] == username, 'poker_balance'] = poker_balance
-        if poker_game_balance is not None:
-            df.loc[df['username'] == username, 'poker_game_balance'] = poker_game_balance
-        if casino_balance is not None:
-            df.loc[df['username'] == username, 'casino_balance'] = casino_balance
-        if registered is not None:
-            df.loc[df['username'] == username, 'registered'] = registered
-        if tournament_name is not None:
-            df.loc[df['username'] == username, 'registered_tournament'] = tournament_name
-        if last_check_time is not None:
-            df.loc[df['username'] == username, 'last_check_time'] = last_check_time
-            
-        # ذخیره فایل
-        df.to_excel(excel_path, index=False)
+        # چند ورکر همزمان روی یک فایل می‌نویسند
+        with _excel_lock:
+            df = pd.read_excel(excel_path)
+            
+            # آپدیت اطلاعات موجد
+            if poker_balance is not None:
+                df.loc[df['username'] == username, 'poker_balance'] = poker_balance
+            if poker_game_balance is not None:
+                df.loc[df['username'] == username, 'poker_game_balance'] = poker_game_balance
+            if casino_balance is not None:
+                df.loc[df['username'] == username, 'casino_balance'] = casino_balance
+            if registered is not None:
+                df.loc[df['username'] == username, 'registered'] = registered
+            if tournament_name is not None:
+                # لیست تورنمنت‌ها با ; در یک سلول ذخیره می‌شود
+                if isinstance(tournament_name, (list, tuple)):
+                    tournament_name = '; '.join(tournament_name)
+                df.loc[df['username'] == username, 'registered_tournament'] = tournament_name
+            if last_check_time is not None:
+                df.loc[df['username'] == username, 'last_check_time'] = last_check_time
+                
+            # ذخیره فایل
+            df.to_excel(excel_path, index=False)
         main_logger.success(f"Successfully updated info for {username}")
         
     except Exception as e:
         main_logger.error(f"Error updating Excel file: {e}")
         raise
 
+def parse_datetime_cell(value):
+    if value is None or pd.isna(value):
+        return None
+    try:
+        # تلاش برای خواندن تاریخ و زمان کامل
+        return pd.to_datetime(str(value))
+    except ValueError:
+        # اگر فقط زمان وارد شده بود، تاریخ امروز رو اضافه می‌کنیم
+        time_str = str(value).strip()
+        today = datetime.now().date()
+        return datetime.combine(today, datetime.strptime(time_str, '%H:%M:%S').time())
+
+def parse_list_cell(value):
+    if value is None or pd.isna(value):
+        return []
+    return [item.strip() for item in str(value).split(';') if item.strip()]
+
+def parse_pattern_cell(value):
+    if value is None or pd.isna(value) or not str(value).strip():
+        return None
+    try:
+        return re.compile(str(value).strip(), re.IGNORECASE)
+    except re.error as e:
+        raise ValueError(f"Invalid tournament_pattern '{value}': {e}")
+
 # خواندن فایل اکانت‌ها
 def read_accounts(excel_path):
     try:
@@ -559,31 +1267,30 @@ def read_accounts(excel_path):
         for _, row in df.iterrows():
             try:
                 # تبدیل تاریخ و زمان به فرمت استاندارد
-                start_datetime = None
-                if pd.notna(row['start_time']):
-                    try:
-                        # تلاش برای خواندن تاریخ و زمان کامل
-                        start_datetime = pd.to_datetime(str(row['start_time']))
-                    except ValueError:
-                        try:
-                            # اگر فقط زمان وارد شده بود، تاریخ امروز رو اضافه می‌کنیم
-                            time_str = str(row['start_time']).strip()
-                            today = datetime.now().date()
-                            start_datetime = datetime.combine(today, datetime.strptime(time_str, '%H:%M:%S').time())
-                        except ValueError:
-                            logging.warning(f"Invalid start_time format for user {row['username']}, setting to None")
-                            start_datetime = None
+                try:
+                    start_datetime = parse_datetime_cell(row['start_time'])
+                except ValueError:
+                    logging.warning(f"Invalid start_time format for user {row['username']}, setting to None")
+                    start_datetime = None
 
                 account = {
                     'username': str(row['username']),
                     'password': str(row['password']),
                     'start_time': start_datetime,  # حالا به جای time از datetime استفاده می‌کنیم
                     'registered': bool(row['registered']) if pd.notna(row['registered']) else False,
-                    'registered_tournament': str(row['registered_tournament']) if pd.notna(row['registered_tournament']) else None,
+                    'registered_tournament': parse_list_cell(row['registered_tournament']) or None,
                     'poker_balance': float(row['poker_balance']) if pd.notna(row['poker_balance']) else 0.0,
                     'poker_game_balance': float(row['poker_game_balance']) if pd.notna(row['poker_game_balance']) else 0.0,
                     'casino_balance': float(row['casino_balance']) if pd.notna(row['casino_balance']) else 0.0,
-                    'last_check_time': str(row['last_check_time']) if pd.notna(row['last_check_time']) else None
+                    'last_check_time': str(row['last_check_time']) if pd.notna(row['last_check_time']) else None,
+                    'excel_file': excel_path,
+                    # فیلترهای انتخاب تورنمنت (ستون‌های اختیاری)
+                    'target_tournaments': parse_list_cell(row.get('target_tournaments')),
+                    'tournament_pattern': parse_pattern_cell(row.get('tournament_pattern')),
+                    'min_buyin': float(row['min_buyin']) if pd.notna(row.get('min_buyin')) else None,
+                    'max_buyin': float(row['max_buyin']) if pd.notna(row.get('max_buyin')) else None,
+                    'start_after': parse_datetime_cell(row.get('start_after')),
+                    'start_before': parse_datetime_cell(row.get('start_before'))
                 }
                 accounts.append(account)
                 
@@ -603,12 +1310,13 @@ def schedule_jobs(accounts, threads):
     scheduled_accounts = [acc for acc in accounts if acc['start_time'] is not None]
     
     logger = logging.getLogger('Scheduler')
+    update_schedule_metrics(scheduled_accounts)
     
     # اجرای فوری اکانت‌های بدون زمان‌بندی
     if immediate_accounts:
         logger.info(f"Starting immediate execution for {len(immediate_accounts)} accounts...")
         with ThreadPoolExecutor(max_workers=threads) as executor:
-            futures = [executor.submit(login_and_register, account) for account in immediate_accounts]
+            futures = submit_accounts(executor, immediate_accounts)
             
             for future in futures:
                 try:
@@ -625,11 +1333,12 @@ def schedule_jobs(accounts, threads):
         while True:
             current_datetime = datetime.now()
             ready_accounts = [acc for acc in scheduled_accounts if acc['start_time'] <= current_datetime]
+            update_schedule_metrics([acc for acc in scheduled_accounts if acc not in ready_accounts])
             
             if ready_accounts:
                 logger.info(f"Starting execution for {len(ready_accounts)} scheduled accounts...")
                 with ThreadPoolExecutor(max_workers=threads) as executor:
-                    futures = [executor.submit(login_and_register, account) for account in ready_accounts]
+                    futures = submit_accounts(executor, ready_accounts)
                     
                     for future in futures:
                         try:
@@ -641,28 +1350,64 @@ def schedule_jobs(accounts, threads):
                 scheduled_accounts = [acc for acc in scheduled_accounts if acc not in ready_accounts]
             
             if not scheduled_accounts:
+                update_schedule_metrics(scheduled_accounts)
                 logger.info("All scheduled accounts have been processed")
                 break
                 
             sleep(30)
 
+def update_schedule_metrics(pending_accounts):
+    SCHEDULED_ACCOUNTS.set(len(pending_accounts))
+    if pending_accounts:
+        NEXT_SCHEDULED_START.set(min(acc['start_time'] for acc in pending_accounts).timestamp())
+    else:
+        NEXT_SCHEDULED_START.set(0)
+
+def parse_balance(text):
+    # بالانس‌ها و بای‌این‌ها با یک قالب عددی (ترکی) خوانده می‌شوند
+    amount = parse_amount(text)
+    if amount is None:
+        raise ValueError(f"Could not parse balance: {text!r}")
+    return amount
+
+def record_balances(account, balances, logger):
+    username = account['username']
+    
+    # آپدیت در اکسل
+    update_account_info(
+        account['excel_file'],
+        username,
+        poker_balance=balances['poker'],
+        poker_game_balance=balances['poker_game'],
+        casino_balance=balances['casino'],
+        last_check_time=datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    )
+    
+    BALANCE_CHECK_RESULTS.labels(status='success').inc()
+    
+    # نمایش در کنسول
+    logger.success(f"""
+Balance Report for {username}:
+🎲 Poker Balance: {balances['poker']} TRY
+🎮 Poker Game Balance: {balances['poker_game']} TRY
+🎰 Casino Balance: {balances['casino']} TRY
+    """)
+    
+    append_balance_history(account, balances)
+
 def check_balance(driver, username, logger, account):
     try:
         # کلیک روی دراپ‌داون بالانس
-        balance_dropdown = WebDriverWait(driver, 10).until(
-            EC.element_to_be_clickable((By.ID, "headerBalances"))
-        )
+        balance_dropdown = locate(driver, 'balance_dropdown', 10, clickable=True)
         balance_dropdown.click()
         logger.info("Balance dropdown clicked")
-        sleep(2)
+        sleep(remaining_time(2))
         
         # خبر برای لود شدن بالانس‌ها
-        WebDriverWait(driver, 20).until(
-            EC.presence_of_element_located((By.ID, "dropdownBalanceList"))
-        )
+        locate(driver, 'balance_list', 20)
         
         # صبر اضافی برای اطمینان از لود کامل مقادیر
-        sleep(3)
+        sleep(remaining_time(3))
         
         # خواندن بالانس‌ها
         balances = {
@@ -673,31 +1418,688 @@ def check_balance(driver, username, logger, account):
         
         # حذف TRY و تبدیل به float
         for key in balances:
-            balances[key] = float(balances[key].replace('TRY', '').replace(',', '.').strip())
+            balances[key] = parse_balance(balances[key])
         
-        # آپدیت در اکسل
-        update_account_info(
-            ACCOUNTS_FILE,
-            username,
-            poker_balance=balances['poker'],
-            poker_game_balance=balances['poker_game'],
-            casino_balance=balances['casino'],
-            last_check_time=datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        )
+        record_balances(account, balances, logger)
+        return balances
         
-        # نمایش در کنسول
-        logger.success(f"""
-Balance Report for {username}:
-🎲 Poker Balance: {balances['poker']} TRY
-🎮 Poker Game Balance: {balances['poker_game']} TRY
-🎰 Casino Balance: {balances['casino']} TRY
-        """)
+    except Exception as e:
+        logger.error(f"Error checking balance: {str(e)}")
+        BALANCE_CHECK_RESULTS.labels(status='error').inc()
+        return None
+
+# ---------------------------------------------------------------------------
+# موتور asyncio: همان مراحل login_and_register ولی با پروتکل WebDriver به صورت async
+# ---------------------------------------------------------------------------
+
+# کلید استاندارد W3C برای ارجاع به المنت
+ELEMENT_KEY = 'element-6066-11e4-a5ca-4ba8d3d5b4d2'
+
+def to_w3c_locator(by, value):
+    # پروتکل W3C فقط css و xpath را می‌شناسد
+    if by == By.ID:
+        return 'css selector', f'[id="{value}"]'
+    if by == By.CLASS_NAME:
+        return 'css selector', f'.{value}'
+    return by, value
+
+async def async_wd_request(wd, method, path, payload=None):
+    url = f"{wd['url']}/session/{wd['id']}{path}" if wd.get('id') else f"{wd['url']}{path}"
+    async with wd['http'].request(method, url, json=payload) as response:
+        data = await response.json(content_type=None)
+    value = (data or {}).get('value')
+    if response.status >= 400:
+        error = value.get('error', 'unknown error') if isinstance(value, dict) else 'unknown error'
+        message = value.get('message', '') if isinstance(value, dict) else ''
+        if error == 'no such element':
+            raise NoSuchElementException(message)
+        if error == 'timeout':
+            raise TimeoutException(message)
+        raise WebDriverException(f"{error}: {message}")
+    return value
+
+async def async_locate(wd, name, timeout, clickable=False):
+    strategies = ordered_strategies(name)
+    started = time()
+    probe = {}
+    
+    async def attempt():
+        probe['result'] = await async_execute(wd, LOCATOR_PROBE_JS, strategies, clickable)
+        element = probe['result']['element']
+        return element[ELEMENT_KEY] if element else None
+    
+    try:
+        element = await async_wait_until(attempt, timeout)
+    except TimeoutException:
+        record_locator_result(name, strategies, probe.get('result'), time() - started)
+        raise TimeoutException(f"Element '{name}' not found with any locator strategy")
+    
+    record_locator_result(name, strategies, probe['result'], time() - started)
+    return element
+
+async def async_find(wd, by, value, parent=None):
+    using, selector = to_w3c_locator(by, value)
+    path = f"/element/{parent}/element" if parent else "/element"
+    element = await async_wd_request(wd, 'POST', path, {'using': using, 'value': selector})
+    return element[ELEMENT_KEY]
+
+async def async_find_all(wd, by, value):
+    using, selector = to_w3c_locator(by, value)
+    elements = await async_wd_request(wd, 'POST', '/elements', {'using': using, 'value': selector})
+    return [element[ELEMENT_KEY] for element in elements]
+
+async def async_click(wd, element):
+    await async_wd_request(wd, 'POST', f"/element/{element}/click", {})
+
+async def async_send_keys(wd, element, text):
+    await async_wd_request(wd, 'POST', f"/element/{element}/value", {'text': text})
+
+async def async_text(wd, element):
+    return await async_wd_request(wd, 'GET', f"/element/{element}/text")
+
+async def async_attribute(wd, element, name):
+    return await async_wd_request(wd, 'GET', f"/element/{element}/attribute/{name}")
+
+async def async_execute(wd, script, *args):
+    return await async_wd_request(wd, 'POST', '/execute/sync', {'script': script, 'args': list(args)})
+
+async def async_get(wd, url):
+    await async_wd_request(wd, 'POST', '/url', {'url': url})
+
+async def async_wait_until(condition, timeout, message=''):
+    # معادل WebDriverWait با asyncio.wait_for
+    async def poll():
+        while True:
+            try:
+                result = await condition()
+                if result:
+                    return result
+            except (WebDriverException, aiohttp.ClientError):
+                pass
+            await asyncio.sleep(0.5)
+    try:
+        return await asyncio.wait_for(poll(), timeout)
+    except asyncio.TimeoutError:
+        raise TimeoutException(message or f"Condition not met within {timeout}s")
+
+async def async_wait_present(wd, by, value, timeout):
+    return await async_wait_until(lambda: async_find(wd, by, value), timeout, f"Element {value} not present")
+
+async def async_wait_invisible(wd, by, value, timeout):
+    async def condition():
+        for element in await async_find_all(wd, by, value):
+            try:
+                if await async_wd_request(wd, 'GET', f"/element/{element}/displayed"):
+                    return False
+            except WebDriverException:
+                continue
+        return True
+    return await async_wait_until(condition, timeout, f"Element {value} still visible")
+
+def find_geckodriver():
+    for path in ('./geckodriver', '/usr/local/bin/geckodriver'):
+        if os.path.exists(path):
+            return path
+    return shutil.which('geckodriver') or 'geckodriver'
+
+def find_free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+async def async_acquire_endpoint(logger):
+    if not _endpoints:
+        raise RuntimeError("DRIVER_BACKEND is remote but REMOTE_ENDPOINTS is empty")
+    while True:
+        await asyncio.to_thread(refresh_endpoint_health)
+        endpoint = try_acquire_endpoint(logger)
+        if endpoint:
+            return endpoint
+        await asyncio.sleep(1)
+
+async def async_create_session(http, logger):
+    options = build_firefox_options()
+    wd = {'http': http, 'id': None, 'process': None, 'endpoint': None}
+    started = time()
+    
+    # هر چیزی که بعد از گرفتن نود یا اجرای geckodriver خطا بدهد (یا لغو شود) باید پاکسازی شود
+    try:
+        if DRIVER_BACKEND == 'remote':
+            wd['endpoint'] = await async_acquire_endpoint(logger)
+            wd['url'] = wd['endpoint']['url']
+        else:
+            options.binary_location = find_firefox_binary()
+            port = find_free_port()
+            wd['process'] = await asyncio.create_subprocess_exec(
+                find_geckodriver(), '--port', str(port),
+                stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
+            )
+            wd['url'] = f"http://127.0.0.1:{port}"
+            wd['browser_process'] = psutil.Process(wd['process'].pid)
+            
+            # صبر برای آماده شدن geckodriver
+            async def ready():
+                async with http.get(f"{wd['url']}/status") as response:
+                    return (await response.json(content_type=None))['value']['ready']
+            await async_wait_until(ready, 30, "geckodriver did not start")
         
-        return balances
+        session = await async_wd_request(wd, 'POST', '/session', {
+            'capabilities': {'alwaysMatch': options.to_capabilities()}
+        })
+        wd['id'] = session['sessionId']
+        await async_wd_request(wd, 'POST', '/timeouts', {'pageLoad': 60000, 'script': 60000})
+    except BaseException:
+        await asyncio.shield(async_close_session(wd, logger))
+        raise
+    
+    INFLIGHT_DRIVERS.inc()
+    wd['counted'] = True
+    DRIVER_START_SECONDS.observe(time() - started)
+    logger.info("Firefox session created successfully")
+    return wd
+
+async def async_close_session(wd, logger):
+    try:
+        if wd.get('id'):
+            await asyncio.wait_for(async_wd_request(wd, 'DELETE', ''), 15)
+            logger.info("Driver closed")
+    except BaseException as e:
+        logger.warning(f"Error closing driver: {e}")
+    finally:
+        if wd.get('counted'):
+            INFLIGHT_DRIVERS.dec()
+        if wd.get('browser_process') and wd['process'].returncode is None:
+            await asyncio.to_thread(kill_process_tree, wd['browser_process'])
+        if wd.get('endpoint'):
+            release_endpoint(wd['endpoint'])
+
+async def async_login(wd, account, logger):
+    await async_get(wd, "https://www.pokerklas628.com/")
+    logger.info("Website loaded successfully")
+    
+    # بستن تبلیغ
+    try:
+        close_button = await async_locate(wd, 'announcement_close', 5, clickable=True)
+        await async_click(wd, close_button)
+        logger.info("Advertisement closed")
+        await asyncio.sleep(1)
+    except Exception:
+        logger.warning("Trying to close advertisement with JavaScript...")
+        try:
+            await async_execute(wd, """
+                var popup = document.querySelector('#announcementPopup');
+                if(popup) popup.style.display = 'none';
+                var backdrop = document.querySelector('.modal-backdrop');
+                if(backdrop) backdrop.remove();
+            """)
+        except Exception:
+            logger.warning("Could not close advertisement")
+    
+    # لاگین
+    # فقط لاگین موفق در هیستوگرام ثبت می‌شود
+    login_started = time()
+    login_button = await async_locate(wd, 'login_button', 10, clickable=True)
+    await async_click(wd, login_button)
+
+    username_input = await async_locate(wd, 'login_username', 10)
+    await async_send_keys(wd, username_input, account['username'])
+    password_input = await async_locate(wd, 'login_password', 5)
+    await async_send_keys(wd, password_input, account['password'])
+    await async_click(wd, await async_locate(wd, 'login_submit', 5))
+
+    verify_button = await async_locate(wd, 'login_verify', 10, clickable=True)
+    await async_click(wd, verify_button)
+    LOGIN_SECONDS.observe(time() - login_started)
+    
+    logger.info("Login successful")
+    await asyncio.sleep(2)
+
+async def async_check_balance(wd, account, logger):
+    try:
+        balance_dropdown = await async_locate(wd, 'balance_dropdown', 10, clickable=True)
+        await async_click(wd, balance_dropdown)
+        logger.info("Balance dropdown clicked")
+        await asyncio.sleep(2)
+        
+        await async_locate(wd, 'balance_list', 20)
+        await asyncio.sleep(3)
+        
+        balances = {}
+        for index, key in enumerate(('poker', 'poker_game', 'casino'), start=1):
+            element = await async_find(wd, By.XPATH, f"//div[@id='dropdownBalanceList']//p[{index}]/small")
+            balances[key] = parse_balance(await async_text(wd, element))
         
+        # کار با اکسل بلاک‌کننده است، در ترد جدا انجام می‌شود
+        await asyncio.to_thread(record_balances, account, balances, logger)
+        return balances
+    
+    except asyncio.CancelledError:
+        raise
     except Exception as e:
         logger.error(f"Error checking balance: {str(e)}")
+        BALANCE_CHECK_RESULTS.labels(status='error').inc()
+        return None
+
+async def async_open_tournaments(wd, logger):
+    logger.info("Navigating to poker page...")
+    await async_get(wd, "https://www.pokerklas628.com/tablegames/poker")
+    
+    await async_wait_until(lambda: async_execute(wd, "return typeof jQuery !== 'undefined'"), 20, "jQuery not loaded")
+    logger.info("jQuery loaded successfully")
+    
+    poker_button = await async_locate(wd, 'poker_button', 20, clickable=True)
+    await async_click(wd, poker_button)
+    logger.info("Clicked on poker button")
+    
+    # به جای کار با iframe، مستقیماً URL رو باز می‌کنیم
+    iframe = await async_locate(wd, 'poker_iframe', 20)
+    poker_url = await async_attribute(wd, iframe, 'src')
+    logger.info(f"Found poker URL: {poker_url}")
+    await async_get(wd, poker_url)
+    
+    await async_locate(wd, 'lobby_root', 30)
+    await async_wait_invisible(wd, By.CLASS_NAME, "lobby-loader", 30)
+    logger.info("Loading completed")
+    await asyncio.sleep(4)
+    
+    tournament_link = await async_locate(wd, 'tournament_link', 30)
+    await asyncio.sleep(2)
+    try:
+        await async_execute(wd, "arguments[0].click();", {ELEMENT_KEY: tournament_link})
+        logger.info("Clicked tournament link with JavaScript")
+    except WebDriverException as js_error:
+        logger.warning(f"JavaScript click failed: {js_error}")
+        await async_click(wd, tournament_link)
+        logger.info("Clicked tournament link with normal click")
+    await asyncio.sleep(3)
+    
+    async def on_tournament_page():
+        current_url = await async_wd_request(wd, 'GET', '/url')
+        return "tournament" in current_url.lower() or bool(await async_find_all(wd, By.CLASS_NAME, "tournament-list"))
+    await async_wait_until(on_tournament_page, 10, "Tournament page not opened")
+    logger.info("Successfully navigated to tournament page")
+
+async def async_read_tournament_info(wd, tournament):
+    info = {}
+    for key, class_name in (('date', "tournaments-list__date"), ('name', "tournaments-list__name-text"),
+                            ('players', "tournaments-list__player-count"), ('buyin', "tournaments-list__buyin-text"),
+                            ('prize', "tournaments-list__prize-text")):
+        element = await async_find(wd, By.CLASS_NAME, class_name, parent=tournament)
+        info[key] = await async_text(wd, element)
+    return info
+
+async def async_register_for_tournament(wd, tournament, tournament_info, logger):
+    try:
+        await async_find(wd, By.CSS_SELECTOR, "button.error", parent=tournament)
+        logger.info(f"Found unregister button - User is already registered in {tournament_info['name']}")
+        return {
+            'status': 'already_registered',
+            'tournament': tournament_info,
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+    except NoSuchElementException:
+        pass
+    
+    try:
+        register_button = await async_find(wd, By.CSS_SELECTOR, "button.tournaments__right-register", parent=tournament)
+        await async_click(wd, register_button)
+        logger.info("Clicked first register button")
+        await asyncio.sleep(2)
+        
+        # دکمه تایید و سپس OK در همان جای فریم ظاهر می‌شوند
+        for label in ('register confirm', 'final OK'):
+            button = await async_locate(wd, 'register_modal_button', 10, clickable=True)
+            await async_click(wd, button)
+            logger.info(f"Clicked {label} button")
+            await asyncio.sleep(2)
+        
+        return {
+            'status': 'success',
+            'tournament': tournament_info,
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"Error during registration process for {tournament_info['name']}: {e}")
+        return {
+            'status': 'error',
+            'tournament': tournament_info,
+            'error': str(e),
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+
+async def async_handle_tournament_registration(wd, account, logger):
+    try:
+        await async_wait_present(wd, By.CLASS_NAME, "tournaments-list__item", 20)
+        logger.info("Tournament list loaded")
+        
+        multi = has_tournament_filter(account)
+        results = []
+        count = len(await async_find_all(wd, By.CLASS_NAME, "tournaments-list__item"))
+        
+        for index in range(count):
+            items = await async_find_all(wd, By.CLASS_NAME, "tournaments-list__item")
+            if index >= len(items):
+                break
+            try:
+                tournament_info = await async_read_tournament_info(wd, items[index])
+            except WebDriverException as e:
+                if not multi:
+                    raise
+                logger.warning(f"Could not read tournament #{index + 1}: {e}")
+                continue
+            
+            if multi and not tournament_matches(tournament_info, account):
+                continue
+            
+            logger.info(f"Tournament details: {tournament_info}")
+            result = await async_register_for_tournament(wd, items[index], tournament_info, logger)
+            REGISTRATION_RESULTS.labels(status=result['status']).inc()
+            results.append(result)
+            
+            if not multi:
+                break
+        
+        await asyncio.to_thread(save_registration_results, account, results)
+        return {
+            'status': summarize_registration(results),
+            'results': results,
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+    
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"Error during tournament registration: {e}")
+        REGISTRATION_RESULTS.labels(status='error').inc()
+        return {
+            'status': 'error',
+            'error': str(e),
+            'results': [],
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+
+async def async_login_and_register_once(http, account, logger):
+    wd = None
+    try:
+        wd = await async_create_session(http, logger)
+        await async_login(wd, account, logger)
+        
+        if CHECK_BALANCE:
+            return await async_check_balance(wd, account, logger)
+        
+        await async_open_tournaments(wd, logger)
+        registration_result = await async_handle_tournament_registration(wd, account, logger)
+        logger.info(f"Tournament registration completed: {registration_result}")
+        return registration_result
+    finally:
+        if wd:
+            # حتی در صورت لغو، سشن باید بسته شود
+            await asyncio.shield(async_close_session(wd, logger))
+
+async def async_login_and_register(http, account, max_attempts=3, delay=5):
+    username = account['username']
+    logger = setup_logger(username)
+    
+    if not CHECK_BALANCE and account['registered'] and not has_tournament_filter(account):
+        logger.info(f"Account {username} is already registered for tournament: {account['registered_tournament']}")
         return None
+    
+    logger.info(f"Starting process for account: {username}")
+    
+    async def attempts():
+        for attempt in range(1, max_attempts + 1):
+            try:
+                return await async_login_and_register_once(http, account, logger)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if attempt < max_attempts:
+                    logger.warning(f"Attempt {attempt}/{max_attempts} failed: {str(e)}")
+                    await asyncio.sleep(delay)
+                else:
+                    logger.error(f"All {max_attempts} attempts failed for {username}. Last error: {str(e)}")
+        return None
+    
+    # مهلت کل اکانت شامل همه تلاش‌ها
+    try:
+        return await asyncio.wait_for(attempts(), ACCOUNT_DEADLINE)
+    except asyncio.TimeoutError:
+        logger.error(f"Account deadline of {ACCOUNT_DEADLINE}s exceeded")
+        REAPED_SESSIONS.inc()
+        return None
+
+async def async_run_accounts(accounts, concurrency):
+    # تعداد سشن‌های همزمان فقط با سمافور محدود می‌شود، نه با تعداد ترد
+    semaphore = asyncio.Semaphore(concurrency)
+    connector = aiohttp.TCPConnector(limit=0)
+    timeout = aiohttp.ClientTimeout(total=90)
+    pending = [acc for acc in accounts if acc['start_time'] is not None]
+    update_schedule_metrics(pending)
+    
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as http:
+        async def run(account):
+            # اکانت‌های زمان‌بندی شده تا زمان شروع صبر می‌کنند
+            if account['start_time'] is not None:
+                delay = (account['start_time'] - datetime.now()).total_seconds()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                pending.remove(account)
+                update_schedule_metrics(pending)
+            
+            QUEUED_ACCOUNTS.inc()
+            async with semaphore:
+                QUEUED_ACCOUNTS.dec()
+                return await async_login_and_register(http, account)
+        
+        results = await asyncio.gather(*(run(account) for account in accounts), return_exceptions=True)
+    
+    for account, result in zip(accounts, results):
+        if isinstance(result, Exception):
+            main_logger.error(f"Task failed for {account['username']}: {result}")
+    return results
+
+# ---------------------------------------------------------------------------
+# تاریخچه بالانس‌ها: هر مشاهده در یک دیتاست Parquet پارتیشن‌بندی شده ذخیره می‌شود
+# ساختار: balance_history/workbook=<file>/date=<YYYY-MM-DD>/<sweep>-<n>-0.parquet
+# ---------------------------------------------------------------------------
+
+BALANCE_COLUMNS = ['poker_balance', 'poker_game_balance', 'casino_balance']
+
+BALANCE_HISTORY_SCHEMA = pa.schema([
+    ('sweep_id', pa.string()),
+    ('sweep_time', pa.timestamp('s')),
+    ('username', pa.string()),
+    ('poker_balance', pa.float64()),
+    ('poker_game_balance', pa.float64()),
+    ('casino_balance', pa.float64()),
+    ('observed_at', pa.timestamp('s')),
+    ('workbook', pa.string()),
+    ('date', pa.string()),
+])
+
+BALANCE_HISTORY_PARTITIONING = ds.partitioning(
+    pa.schema([('workbook', pa.string()), ('date', pa.string())]), flavor='hive'
+)
+
+# هر اجرای برنامه یک sweep است
+SWEEP_TIME = datetime.now().replace(microsecond=0)
+SWEEP_ID = SWEEP_TIME.strftime('%Y%m%dT%H%M%S')
+
+_balance_observations = []
+_balance_observations_lock = threading.Lock()
+_balance_flushes = 0
+
+def append_balance_history(account, balances):
+    with _balance_observations_lock:
+        _balance_observations.append({
+            'sweep_id': SWEEP_ID,
+            'sweep_time': SWEEP_TIME,
+            'username': account['username'],
+            'poker_balance': balances['poker'],
+            'poker_game_balance': balances['poker_game'],
+            'casino_balance': balances['casino'],
+            'observed_at': datetime.now().replace(microsecond=0),
+            'workbook': os.path.basename(account['excel_file']),
+            'date': SWEEP_TIME.strftime('%Y-%m-%d'),
+        })
+
+def flush_balance_history():
+    global _balance_flushes
+    with _balance_observations_lock:
+        if not _balance_observations:
+            return
+        rows = list(_balance_observations)
+        _balance_observations.clear()
+        _balance_flushes += 1
+        flush_number = _balance_flushes
+    
+    try:
+        table = pa.Table.from_pylist(rows, schema=BALANCE_HISTORY_SCHEMA)
+        pq.write_to_dataset(
+            table,
+            BALANCE_HISTORY_DIR,
+            partitioning=BALANCE_HISTORY_PARTITIONING,
+            basename_template=f"{SWEEP_ID}-{flush_number}-{{i}}.parquet",
+            existing_data_behavior='overwrite_or_ignore'
+        )
+        main_logger.info(f"Saved {len(rows)} balance observations to {BALANCE_HISTORY_DIR}")
+    except Exception as e:
+        main_logger.error(f"Error saving balance history: {e}")
+
+def sweep_date(sweep_id):
+    return f"{sweep_id[:4]}-{sweep_id[4:6]}-{sweep_id[6:8]}"
+
+def load_balance_table(columns, workbooks=None, sweep_ids=None, since=None, until=None):
+    if not os.path.isdir(BALANCE_HISTORY_DIR):
+        return None
+    
+    dataset = ds.dataset(BALANCE_HISTORY_DIR, format='parquet', partitioning=BALANCE_HISTORY_PARTITIONING)
+    
+    # فیلترها روی پارتیشن‌ها اعمال می‌شوند تا فقط فایل‌های لازم خوانده شوند
+    filters = []
+    if workbooks:
+        filters.append(ds.field('workbook').isin(workbooks))
+    if sweep_ids:
+        dates = sorted({sweep_date(sweep) for sweep in sweep_ids})
+        filters.append(ds.field('date').isin(dates) & ds.field('sweep_id').isin(list(sweep_ids)))
+    if since:
+        filters.append((ds.field('date') >= sweep_date(since)) & (ds.field('sweep_id') >= since))
+    if until:
+        filters.append((ds.field('date') <= sweep_date(until)) & (ds.field('sweep_id') <= until))
+    
+    expression = None
+    for condition in filters:
+        expression = condition if expression is None else expression & condition
+    return dataset.to_table(columns=columns, filter=expression)
+
+def load_balance_history(columns, workbooks=None, sweep_ids=None):
+    table = load_balance_table(columns, workbooks, sweep_ids)
+    if table is None:
+        return pd.DataFrame(columns=columns)
+    return table.to_pandas()
+
+def list_sweeps(workbooks=None):
+    sweeps = load_balance_history(['workbook', 'sweep_id', 'sweep_time'], workbooks)
+    return sweeps.drop_duplicates().sort_values(['workbook', 'sweep_time'])
+
+def balance_deltas(workbooks=None, since=None, until=None):
+    # بدون since/until، دو sweep آخر هر فایل با هم مقایسه می‌شوند
+    sweeps = list_sweeps(workbooks)
+    pairs = {}
+    for workbook, group in sweeps.groupby('workbook'):
+        ids = list(group['sweep_id'])
+        if since or until:
+            # مثل balance_totals بازه‌ای: اولین sweep >= since و آخرین sweep <= until
+            first = next((sweep for sweep in ids if sweep >= since), None) if since else ids[0]
+            last = next((sweep for sweep in reversed(ids) if sweep <= until), None) if until else ids[-1]
+            if first is None or last is None or first > last:
+                continue
+        elif len(ids) >= 2:
+            first, last = ids[-2], ids[-1]
+        else:
+            continue
+        pairs[workbook] = (first, last)
+    
+    if not pairs:
+        return pd.DataFrame()
+    
+    sweep_ids = {sweep for pair in pairs.values() for sweep in pair}
+    history = load_balance_history(['workbook', 'sweep_id', 'username', 'observed_at'] + BALANCE_COLUMNS,
+                                   list(pairs), sweep_ids)
+    # آخرین مشاهده هر اکانت در هر sweep
+    history = history.sort_values('observed_at').drop_duplicates(['workbook', 'sweep_id', 'username'], keep='last')
+    
+    frames = []
+    for workbook, (first, last) in pairs.items():
+        rows = history[history['workbook'] == workbook].set_index('username')
+        before = rows[rows['sweep_id'] == first][BALANCE_COLUMNS]
+        after = rows[rows['sweep_id'] == last][BALANCE_COLUMNS]
+        delta = after.sub(before).dropna(how='all')
+        delta.columns = [f"{column}_delta" for column in BALANCE_COLUMNS]
+        delta = delta.join(after).reset_index()
+        delta.insert(0, 'workbook', workbook)
+        delta.insert(1, 'from_sweep', first)
+        delta.insert(2, 'to_sweep', last)
+        frames.append(delta)
+    
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+def latest_observations(history):
+    # آخرین مشاهده هر اکانت در هر sweep؛ کلید (workbook, sweep_id, username) به یک int64 تبدیل می‌شود
+    # تا مرتب‌سازی روی عدد انجام شود نه رشته
+    key = None
+    for column in ['workbook', 'sweep_id', 'username']:
+        codes = pc.dictionary_encode(history[column].combine_chunks())
+        indices = codes.indices.cast(pa.int64())
+        key = indices if key is None else pc.add(pc.multiply(key, len(codes.dictionary)), indices)
+    
+    order = pc.sort_indices(pa.table({'key': key, 'observed_at': history['observed_at']}),
+                            sort_keys=[('key', 'ascending'), ('observed_at', 'ascending')])
+    key = key.take(order)
+    # ردیف آخر هر گروه جایی است که کلید ردیف بعدی فرق می‌کند
+    is_last = pa.concat_arrays([pc.not_equal(key[:-1], key[1:]), pa.array([True])])
+    return history.take(order.filter(is_last))
+
+def balance_totals(workbooks=None, since=None, until=None):
+    sweep_keys = ['workbook', 'sweep_id', 'sweep_time']
+    history = load_balance_table(sweep_keys + ['username', 'observed_at'] + BALANCE_COLUMNS,
+                                 workbooks, since=since, until=until)
+    if history is None or history.num_rows == 0:
+        return pd.DataFrame()
+    
+    # حذف تکراری‌ها و جمع‌ها در pyarrow انجام می‌شوند؛ فقط یک ردیف برای هر sweep به pandas می‌رود
+    totals = latest_observations(history).group_by(sweep_keys).aggregate(
+        [(column, 'sum') for column in BALANCE_COLUMNS] + [('username', 'count')]
+    )
+    totals = totals.rename_columns([
+        'accounts' if name == 'username_count' else name.removesuffix('_sum') for name in totals.column_names
+    ])
+    totals = totals.select(sweep_keys + BALANCE_COLUMNS + ['accounts'])
+    return totals.sort_by([('workbook', 'ascending'), ('sweep_time', 'ascending')]).to_pandas()
+
+def run_history_query(query, excel_files, since=None, until=None):
+    workbooks = [os.path.basename(path) for path in excel_files] or None
+    
+    if query == 'deltas':
+        result = balance_deltas(workbooks, since, until)
+    elif query == 'changed':
+        result = balance_deltas(workbooks, since, until)
+        if not result.empty:
+            delta_columns = [f"{column}_delta" for column in BALANCE_COLUMNS]
+            result = result[(result[delta_columns].fillna(0) != 0).any(axis=1)]
+            if result.empty:
+                main_logger.info("No account balance changed between the compared sweeps")
+                return result
+    else:
+        result = balance_totals(workbooks, since, until)
+    
+    if result.empty:
+        main_logger.warning("No balance history found for this query")
+    else:
+        print(result.to_string(index=False))
+    return result
 
 def create_excel_if_not_exists(excel_path):
     try:
@@ -715,7 +2117,13 @@ def create_excel_if_not_exists(excel_path):
                 'poker_balance',
                 'poker_game_balance',
                 'casino_balance',
-                'last_check_time'
+                'last_check_time',
+                'target_tournaments',
+                'tournament_pattern',
+                'min_buyin',
+                'max_buyin',
+                'start_after',
+                'start_before'
             ]).astype({
                 'username': 'str',
                 'password': 'str',
@@ -726,7 +2134,13 @@ def create_excel_if_not_exists(excel_path):
                 'poker_balance': 'float64',
                 'poker_game_balance': 'float64',
                 'casino_balance': 'float64',
-                'last_check_time': 'object'
+                'last_check_time': 'object',
+                'target_tournaments': 'str',  # نام‌ها با ; جدا می‌شوند
+                'tournament_pattern': 'str',
+                'min_buyin': 'float64',
+                'max_buyin': 'float64',
+                'start_after': 'object',
+                'start_before': 'object'
             })
             
             # ذخیره فایل
@@ -762,6 +2176,22 @@ if __name__ == "__main__":
     print_banner()
     setup_logging()  # تنظیم لاگینگ در ابتدای برنامه
     
+    # فقط کوئری روی تاریخچه، بدون باز کردن مرورگر یا اکسل‌ها
+    if args.history:
+        run_history_query(args.history, ACCOUNTS_FILE, args.since, args.until)
+        raise SystemExit(0)
+    
+    start_watchdog()
+    atexit.register(reap_browser_processes)
+    
+    if METRICS_PORT:
+        try:
+            start_http_server(METRICS_PORT, addr=METRICS_ADDR)
+            main_logger.info(f"Metrics available at http://{METRICS_ADDR}:{METRICS_PORT}/metrics")
+        except OSError as e:
+            # مثلا وقتی پورت توسط اجرای دیگری گرفته شده
+            main_logger.warning(f"Could not start metrics server on port {METRICS_PORT}: {e}")
+    
     # پردازش هر فایل اکسل به ترتیب
     for excel_file in ACCOUNTS_FILE:
         main_logger.info(f"Processing Excel file: {excel_file}")
@@ -771,6 +2201,16 @@ if __name__ == "__main__":
             accounts = read_accounts(excel_file)
             main_logger.info(f"Loaded {len(accounts)} accounts from {excel_file}")
             
+            if ENGINE == 'async':
+                # در موتور async زمان‌بندی و همزمانی داخل یک event loop انجام می‌شود
+                if RUN_EVENT:
+                    main_logger.info("Running tournament registration (async engine)...")
+                    asyncio.run(async_run_accounts(accounts, ASYNC_CONCURRENCY))
+                if CHECK_BALANCE:
+                    main_logger.info("Running balance check (async engine)...")
+                    asyncio.run(async_run_accounts([dict(acc, start_time=None) for acc in accounts], ASYNC_CONCURRENCY))
+                continue
+            
             if RUN_EVENT:
                 main_logger.info("Running tournament registration...")
                 schedule_jobs(accounts, THREADS)
@@ -779,7 +2219,7 @@ if __name__ == "__main__":
                 main_logger.info("Running balance check...")
                 # برای چک بالانس، همه اکانت‌ها را مستقیماً پردازش می‌کنیم
                 with ThreadPoolExecutor(max_workers=THREADS) as executor:
-                    futures = [executor.submit(login_and_register, account) for account in accounts]
+                    futures = submit_accounts(executor, accounts)
                     for future in futures:
                         try:
                             future.result()
@@ -790,6 +2230,9 @@ if __name__ == "__main__":
         except Exception as e:
             main_logger.error(f"Error processing file {excel_file}: {e}")
             continue
+        finally:
+            flush_balance_history()
             
+    log_locator_report()
     main_logger.success("All Excel files processed successfully")
 
@@ -0,0 +1,61 @@
+import os
+import sys
+from datetime import datetime
+
+# main.py آرگومان‌ها را هنگام import پارس می‌کند
+sys.argv = ['main.py', '--history', 'totals']
+os.environ.setdefault('THREADS', '1')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+
+import main
+
+SWEEPS = ['20240101T200000', '20240102T200000', '20240103T200000']
+
+
+def write_sweep(monkeypatch, sweep_id, balances):
+    sweep_time = datetime.strptime(sweep_id, '%Y%m%dT%H%M%S')
+    monkeypatch.setattr(main, 'SWEEP_ID', sweep_id)
+    monkeypatch.setattr(main, 'SWEEP_TIME', sweep_time)
+    for username, poker in balances.items():
+        account = {'username': username, 'excel_file': 'accounts/team.xlsx'}
+        main.append_balance_history(account, {'poker': poker, 'poker_game': 0.0, 'casino': 1.0})
+    main.flush_balance_history()
+
+
+@pytest.fixture
+def history(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'BALANCE_HISTORY_DIR', str(tmp_path / 'balance_history'))
+    write_sweep(monkeypatch, SWEEPS[0], {'alice': 100.0, 'bob': 50.0})
+    write_sweep(monkeypatch, SWEEPS[1], {'alice': 150.0, 'bob': 50.0})
+    write_sweep(monkeypatch, SWEEPS[2], {'alice': 150.0, 'bob': 20.0})
+    # مشاهده دوم در همان sweep جایگزین مشاهده قبلی می‌شود
+    write_sweep(monkeypatch, SWEEPS[2], {'bob': 30.0})
+
+
+def poker_deltas(result):
+    return dict(zip(result['username'], result['poker_balance_delta']))
+
+
+def test_deltas_compare_the_last_two_sweeps(history):
+    result = main.run_history_query('deltas', [])
+    assert set(result['from_sweep']) == {SWEEPS[1]}
+    assert set(result['to_sweep']) == {SWEEPS[2]}
+    assert poker_deltas(result) == {'alice': 0.0, 'bob': -20.0}
+
+
+def test_changed_applies_since_and_until(history):
+    result = main.run_history_query('changed', [])
+    assert poker_deltas(result) == {'bob': -20.0}
+
+    result = main.run_history_query('changed', [], since=SWEEPS[0], until=SWEEPS[1])
+    assert poker_deltas(result) == {'alice': 50.0}
+
+
+def test_totals_use_the_latest_observation_per_sweep(history):
+    result = main.run_history_query('totals', [], since=SWEEPS[1])
+    assert list(result['sweep_id']) == SWEEPS[1:]
+    assert list(result['poker_balance']) == [200.0, 180.0]
+    assert list(result['casino_balance']) == [2.0, 2.0]
+    assert list(result['accounts']) == [2, 2]
@@ -0,0 +1,35 @@
+import os
+import sys
+
+# main.py آرگومان‌ها را هنگام import پارس می‌کند
+sys.argv = ['main.py', '--history', 'totals']
+os.environ.setdefault('THREADS', '1')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+
+from main import parse_amount, parse_balance
+
+
+def test_dot_is_thousands_separator():
+    assert parse_amount("1.000 TRY") == 1000.0
+    assert parse_amount("2.500 ₺") == 2500.0
+    assert parse_amount("1.000.000 TRY") == 1000000.0
+
+
+def test_comma_is_decimal_separator():
+    assert parse_amount("1.000,50 TRY") == 1000.5
+    assert parse_amount("10,5 TRY") == 10.5
+
+
+def test_plain_and_missing_amounts():
+    assert parse_amount("₺10") == 10.0
+    assert parse_amount("Free") is None
+
+
+def test_balances_use_the_same_format():
+    assert parse_balance("1.000 TRY") == 1000.0
+    assert parse_balance("1.000,50 TRY") == 1000.5
+    assert parse_balance("0,00 TRY") == 0.0
+    with pytest.raises(ValueError):
+        parse_balance("TRY")
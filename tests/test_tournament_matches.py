@@ -0,0 +1,33 @@
+import os
+import sys
+
+# main.py آرگومان‌ها را هنگام import پارس می‌کند
+sys.argv = ['main.py', '--history', 'totals']
+os.environ.setdefault('THREADS', '1')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from main import tournament_matches
+
+
+def make_account(**filters):
+    account = {'target_tournaments': [], 'tournament_pattern': None, 'min_buyin': None,
+               'max_buyin': None, 'start_after': None, 'start_before': None}
+    account.update(filters)
+    return account
+
+
+def tournament(name, buyin='100 TRY'):
+    return {'name': name, 'buyin': buyin, 'date': '', 'players': '', 'prize': ''}
+
+
+def test_target_names_match_exactly():
+    account = make_account(target_tournaments=['Sunday 100'])
+    assert tournament_matches(tournament('Sunday 100'), account)
+    assert tournament_matches(tournament(' sunday 100 '), account)
+    assert not tournament_matches(tournament('Sunday 1000 Deepstack'), account)
+
+
+def test_buyin_range_uses_thousands_separator():
+    account = make_account(min_buyin=500.0)
+    assert tournament_matches(tournament('Big', '1.000 TRY'), account)
+    assert not tournament_matches(tournament('Small', '100 TRY'), account)